@@ -560,6 +560,10 @@ dialog.info_dialog("Window information",
                 self.app.monitor.add_watch(folder.path)
             
             self.__processFolder(folder)
+            
+        self.abbreviationIndex = AbbreviationIndex(self.allFolders, self.allItems)
+        self.hotKeyIndex = self.__buildHotkeyIndex(self.hotKeys)
+        self.hotKeyFolderIndex = self.__buildHotkeyIndex(self.hotKeyFolders)
         
         self.globalHotkeys = []
         self.globalHotkeys.append(self.configHotkey)
@@ -577,6 +581,18 @@ dialog.info_dialog("Window information",
 
         self.lock.release()
                     
+    def __buildHotkeyIndex(self, targets):
+        """
+        Index the given folders/items by hotkey, so a keypress only needs checking against
+        those using the pressed hotkey.
+        
+        @return: dict of (modifiers tuple, key) to list of folders/items, in their original order
+        """
+        index = {}
+        for target in targets:
+            index.setdefault((tuple(target.modifiers), target.hotKey), []).append(target)
+        return index
+                    
     def __processFolder(self, parentFolder):        
         if not self.app.monitor.has_watch(parentFolder.path):
             self.app.monitor.add_watch(parentFolder.path)
@@ -755,18 +771,13 @@ class GlobalHotkey(AbstractHotkey):
             key = self.hotKey
             modifiers = self.modifiers
 
-        ret = ""
-
-        for modifier in modifiers:
-            ret += modifier
-            ret += "+"
-
         if key == ' ':
-            ret += "<space>"
+            key = "<space>"
+            
+        if len(modifiers) > 0:
+            return "+".join(modifiers) + "+" + key
         else:
-            ret += key
-
-        return ret
+            return key
         
     def __str__(self):
         return _("AutoKey global hotkeys")
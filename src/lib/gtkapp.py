@@ -215,9 +215,7 @@ class Application:
         logging.info("Shutting down")
         self.service.shutdown()
         self.monitor.stop()
-        Gdk.threads_enter()
-        Gtk.main_quit()
-        Gdk.threads_leave()
+        Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, Gtk.main_quit)
         os.remove(LOCK_FILE)
         logging.debug("All shutdown tasks complete... quitting")
             
@@ -227,7 +225,8 @@ class Application:
         
         @param message: Message to show in the popup
         """
-        self.notifier.notify_error(message)
+        # Called from script threads - run the notifier on the GTK main loop, holding the GDK lock
+        Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self.notifier.notify_error, message)
         
     def update_notifier_visibility(self):
         self.notifier.update_visible_status()
@@ -244,9 +243,8 @@ class Application:
             self.configWindow.deiconify()
             
     def show_configure_async(self):
-        Gdk.threads_enter()
-        self.show_configure()
-        Gdk.threads_leave()
+        # Called from the hotkey handler thread - run on the GTK main loop, holding the GDK lock
+        Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self.show_configure)
                 
     def main(self):
         logging.info("Entering main()")
@@ -16,7 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>..
 
 #import pynotify, gtk, gettext
-from gi.repository import Gtk, Gdk, Notify
+from gi.repository import Gtk, Gdk, GLib, Notify
 import gettext
 
 import popupmenu
@@ -153,13 +153,11 @@ class Notifier:
         self.icon.set_from_icon_name(ConfigManager.SETTINGS[NOTIFICATION_ICON])
         
     def show_notify(self, message, iconName):
-        Gdk.threads_enter()
         n = Notify.Notification.new("AutoKey", message, iconName)
         n.set_urgency(Notify.Urgency.LOW)
         if ConfigManager.SETTINGS[SHOW_TRAY_ICON]:
             n.attach_to_status_icon(self.icon)
         n.show()
-        Gdk.threads_leave()
         
                     
 
@@ -174,7 +172,8 @@ class IndicatorNotifier:
                                                 AppIndicator3.IndicatorCategory.APPLICATION_STATUS)
                                                 
         self.indicator.set_attention_icon(common.ICON_FILE_NOTIFICATION_ERROR)
-        self.update_visible_status()           
+        self.update_visible_status()
+        self.menuRebuildPending = False
         self.rebuild_menu()
         
     def update_visible_status(self):
@@ -187,6 +186,23 @@ class IndicatorNotifier:
         self.indicator.set_status(AppIndicator3.IndicatorStatus.PASSIVE)
         
     def rebuild_menu(self):
+        """
+        Schedule a rebuild of the menu from the main loop, holding the GDK lock. Bursts of
+        configuration changes (e.g. while editing in the main window) result in a single rebuild.
+        
+        The first build, scheduled from __init__, runs before any notify_error callback, as
+        those are queued later at the same priority.
+        """
+        if not self.menuRebuildPending:
+            self.menuRebuildPending = True
+            Gdk.threads_add_idle(GLib.PRIORITY_DEFAULT_IDLE, self.__rebuild_menu_idle)
+
+    def __rebuild_menu_idle(self):
+        self.menuRebuildPending = False
+        self.__build_menu()
+        return False
+
+    def __build_menu(self):
         # Main Menu items
         self.errorItem = Gtk.MenuItem(_("View script error"))
         
@@ -242,11 +258,9 @@ class IndicatorNotifier:
         self.indicator.set_status(AppIndicator3.IndicatorStatus.ATTENTION)
         
     def show_notify(self, message, iconName):
-        Gdk.threads_enter()
         n = Notify.Notification.new("AutoKey", message, iconName)
         n.set_urgency(Notify.Urgency.LOW)
         n.show()
-        Gdk.threads_leave()
         
     def update_tool_tip(self):
         pass
@@ -70,6 +70,7 @@ class XInterfaceBase(threading.Thread):
         self.app = app
         self.lastChars = [] # QT4 Workaround
         self.__enableQT4Workaround = False # QT4 Workaround
+        self.__mutterShellRunning = None # Mutter workaround - checked on first use
         self.shutdown = False
         
         # Event loop
@@ -213,7 +214,14 @@ class XInterfaceBase(threading.Thread):
     def __needsMutterWorkaround(self, item):
         if Key.SUPER not in item.modifiers:
             return False
-    
+            
+        if self.__mutterShellRunning is None:
+            # Only spawn ps once - this is checked for every hotkey and every new window
+            self.__mutterShellRunning = self.__checkMutterShellRunning()
+                
+        return self.__mutterShellRunning
+        
+    def __checkMutterShellRunning(self):
         try:
             output = subprocess.check_output(["ps", "-eo", "command"])
             lines = output.splitlines()
@@ -676,6 +684,21 @@ class XInterfaceBase(threading.Thread):
         logger.debug("Send special key: [%r]", keyName)
         self.__sendKeyCode(self.__lookupKeyCode(keyName))
 
+    def send_key_repeat(self, keyName, count):
+        """
+        Send a specific non-printing key the given number of times, as a single batch
+        """
+        if count > 0:
+            self.__enqueue(self.__sendKeyRepeat, keyName, count)
+
+    def __sendKeyRepeat(self, keyName, count):
+        logger.debug("Send special key: [%r] x %d", keyName, count)
+        keyCode = self.__lookupKeyCode(keyName)
+        focus = self.localDisplay.get_input_focus().focus
+        for i in xrange(count):
+            self.__sendKeyCode(keyCode, theWindow=focus)
+        self.__flush()
+
     def fake_keypress(self, keyName):
          self.__enqueue(self.__fakeKeypress, keyName)
          
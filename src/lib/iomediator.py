@@ -90,20 +90,126 @@ class Key:
     def is_key(klass, keyString):
         # Key strings must be treated as case insensitive - always convert to lowercase
         # before doing any comparisons
-        return keyString.lower() in klass.__dict__.values() or keyString.startswith("<code")
+        return keyString.lower() in klass._KEY_NAMES or keyString.startswith("<code")
 
-import datetime, time, threading, Queue, re, logging
+# Set of all key name strings defined above, for constant time lookups in is_key()
+Key._KEY_NAMES = frozenset(value for name, value in Key.__dict__.items()
+                           if not name.startswith('_') and isinstance(value, basestring))
+
+import datetime, time, threading, collections, re, logging
 
 _logger = logging.getLogger("iomediator")
 
 MODIFIERS = [Key.CONTROL, Key.ALT, Key.ALT_GR, Key.SHIFT, Key.SUPER, Key.HYPER, Key.META, Key.CAPSLOCK, Key.NUMLOCK]
+MODIFIERS_SET = frozenset(MODIFIERS)
 HELD_MODIFIERS = [Key.CONTROL, Key.ALT, Key.SUPER, Key.SHIFT, Key.HYPER, Key.META]
+# Bit flags used to track which of the held modifiers are currently pressed
+HELD_MODIFIER_BITS = dict((modifier, 1 << i) for i, modifier in enumerate(HELD_MODIFIERS))
+# Sorted list of held modifiers for every possible combination of HELD_MODIFIER_BITS.
+# The lists are shared between keypresses, so listeners must not modify them
+HELD_MODIFIER_TABLE = [[modifier for modifier in sorted(HELD_MODIFIERS) if mask & HELD_MODIFIER_BITS[modifier]]
+                       for mask in xrange(1 << len(HELD_MODIFIERS))]
+# IoMediator attribute holding the current state of each modifier
+MODIFIER_ATTRIBUTES = {
+                       Key.CONTROL : "modControl",
+                       Key.ALT : "modAlt",
+                       Key.ALT_GR : "modAltGr",
+                       Key.SHIFT : "modShift",
+                       Key.SUPER : "modSuper",
+                       Key.HYPER : "modHyper",
+                       Key.META : "modMeta",
+                       Key.CAPSLOCK : "modCapsLock",
+                       Key.NUMLOCK : "modNumLock"
+                       }
 NAVIGATION_KEYS = [Key.LEFT, Key.RIGHT, Key.UP, Key.DOWN, Key.BACKSPACE, Key.HOME, Key.END, Key.PAGE_UP, Key.PAGE_DOWN]
 
 #KEY_SPLIT_RE = re.compile("(<.+?>\+{0,1})", re.UNICODE)
-KEY_SPLIT_RE = re.compile("(<[^<>]+>\+?)", re.UNICODE)
+KEY_SPLIT_RE = re.compile("(<[^<>]+>\+?)")
+# Matches the same key-like sections as KEY_SPLIT_RE (group 1), or the text between them (group 2)
+KEY_OR_TEXT_RE = re.compile("(<[^<>]+>\+?)|((?:[^<]|<(?![^<>]+>))+)")
 SEND_LOCK = threading.Lock()
 
+# Size limit of the caches of split/classified strings and send plans, keyed by the string passed to send_string
+SPLIT_CACHE_SIZE = 512
+_splitCache = {}
+
+def _split_tokens(string):
+    """
+    Split the given string into the same sections as KEY_SPLIT_RE, and classify each section.
+    Empty sections are dropped. Results are cached as the same expansion strings are
+    typically sent many times.
+    
+    @return: tuple of (section, isKey, isModifier) tuples
+    """
+    try:
+        return _splitCache[string]
+    except KeyError:
+        pass
+        
+    tokens = []
+    keyNames = Key._KEY_NAMES
+    for match in KEY_OR_TEXT_RE.finditer(string):
+        section = match.group(1)
+        if section is not None:
+            # Same test as Key.is_key()
+            isKey = section.lower() in keyNames or section.startswith("<code")
+            # Modifier application, i.e. modifier followed by '+'. Every modifier is a key name.
+            isModifier = section[-1] == '+' and section[:-1] in MODIFIERS_SET
+            tokens.append((section, isKey, isModifier))
+        else:
+            tokens.append((match.group(2), False, False))
+    
+    tokens = tuple(tokens)
+    if len(_splitCache) >= SPLIT_CACHE_SIZE:
+        _splitCache.clear()
+    _splitCache[string] = tokens
+    return tokens
+
+_planCache = {}
+
+def _plan_send(string):
+    """
+    Work out the interface calls needed to send the given string, without touching
+    the interface. Plans are cached in the same way as the results of _split_tokens.
+    
+    @return: tuple of (interface method name, args) tuples
+    """
+    try:
+        return _planCache[string]
+    except KeyError:
+        pass
+        
+    plan = []
+    modifiers = []
+    tokens = _split_tokens(string.replace('\n', "<enter>").replace('\t', "<tab>"))
+    for section, isKey, isModifier in tokens:
+        if isModifier:
+            # Section is a modifier application (modifier followed by '+')
+            modifiers.append(section[:-1])
+            
+        else:
+            if len(modifiers) > 0:
+                # Modifiers ready for application - send modified key
+                if isKey:
+                    plan.append(("send_modified_key", (section, modifiers)))
+                else:
+                    plan.append(("send_modified_key", (section[0], modifiers)))
+                    if len(section) > 1:
+                        plan.append(("send_string", (section[1:],)))
+                modifiers = []
+            else:
+                # Normal string/key operation
+                if isKey:
+                    plan.append(("send_key", (section,)))
+                else:
+                    plan.append(("send_string", (section,)))
+                    
+    plan = tuple(plan)
+    if len(_planCache) >= SPLIT_CACHE_SIZE:
+        _planCache.clear()
+    _planCache[string] = plan
+    return plan
+
 from interface import *
 from configmanager import *
 
@@ -116,27 +222,47 @@ class IoMediator(threading.Thread):
     This class must not store or maintain any configuration details.
     """
     
-    # List of targets interested in receiving keypress, hotkey and mouse events
-    listeners = []
+    # Targets interested in receiving keypress, hotkey and mouse events. This is an immutable
+    # tuple that is replaced as a whole by add_listener/remove_listener, so readers can iterate
+    # it without locking even while another thread adds or removes a listener.
+    listeners = ()
+    listenersLock = threading.Lock()
+    
+    @classmethod
+    def add_listener(klass, target):
+        with klass.listenersLock:
+            klass.listeners = klass.listeners + (target,)
+            
+    @classmethod
+    def remove_listener(klass, target):
+        """
+        Remove the given target from the listeners. Raises ValueError if it is not a listener.
+        """
+        with klass.listenersLock:
+            listeners = list(klass.listeners)
+            listeners.remove(target)
+            klass.listeners = tuple(listeners)
     
     def __init__(self, service):
         threading.Thread.__init__(self, name="KeypressHandler-thread")
-        self.queue = Queue.Queue()
-        self.listeners.append(service)
+        # Keypress events from the interface. There is exactly one producer (the interface)
+        # and one consumer (this thread), so deque's atomic append/popleft is sufficient
+        self.queue = collections.deque()
+        self.queueEvent = threading.Event()
+        self.add_listener(service)
         self.interfaceType = ConfigManager.SETTINGS[INTERFACE_TYPE]
         
         # Modifier tracking
-        self.modifiers = {
-                          Key.CONTROL : False,
-                          Key.ALT : False,
-                          Key.ALT_GR: False,
-                          Key.SHIFT : False,
-                          Key.SUPER : False,
-                          Key.HYPER : False,
-                          Key.META  : False,
-                          Key.CAPSLOCK : False,
-                          Key.NUMLOCK : False
-                          }
+        self.modControl = False
+        self.modAlt = False
+        self.modAltGr = False
+        self.modShift = False
+        self.modSuper = False
+        self.modHyper = False
+        self.modMeta = False
+        self.modCapsLock = False
+        self.modNumLock = False
+        self.heldMask = 0
         
         if self.interfaceType == X_RECORD_INTERFACE:
             self.interface = XRecordInterface(self, service.app)
@@ -150,14 +276,15 @@ class IoMediator(threading.Thread):
         
     def shutdown(self):
         self.interface.cancel()
-        self.queue.put_nowait((None, None, None))
+        self.queue.append((None, None, None))
+        self.queueEvent.set()
         self.join()
 
     # Callback methods for Interfaces ----
 
     def set_modifier_state(self, modifier, state):
         _logger.debug("Set modifier %s to %r", modifier, state)
-        self.modifiers[modifier] = state
+        self.__setModifier(modifier, state)
     
     def handle_modifier_down(self, modifier):
         """
@@ -165,12 +292,12 @@ class IoMediator(threading.Thread):
         """
         _logger.debug("%s pressed", modifier)
         if modifier in (Key.CAPSLOCK, Key.NUMLOCK):
-            if self.modifiers[modifier]:
-                self.modifiers[modifier] = False
+            if getattr(self, MODIFIER_ATTRIBUTES[modifier]):
+                self.__setModifier(modifier, False)
             else:
-                self.modifiers[modifier] = True
+                self.__setModifier(modifier, True)
         else:
-            self.modifiers[modifier] = True
+            self.__setModifier(modifier, True)
         
     def handle_modifier_up(self, modifier):
         """
@@ -179,31 +306,39 @@ class IoMediator(threading.Thread):
         _logger.debug("%s released", modifier)
         # Caps and num lock are handled on key down only
         if not modifier in (Key.CAPSLOCK, Key.NUMLOCK):
-            self.modifiers[modifier] = False
+            self.__setModifier(modifier, False)
     
     def handle_keypress(self, keyCode, windowName, windowClass):
         """
         Looks up the character for the given key code, applying any 
         modifiers currently in effect, and passes it to the expansion service.
         """
-        self.queue.put_nowait((keyCode, windowName, windowClass))
+        self.queue.append((keyCode, windowName, windowClass))
+        self.queueEvent.set()
         
     def run(self):
+        queue = self.queue
+        
         while True:
-            keyCode, windowName, windowClass = self.queue.get()
-            if keyCode is None and windowName is None:
-                break
+            self.queueEvent.wait()
+            self.queueEvent.clear()
             
-            numLock = self.modifiers[Key.NUMLOCK]
-            modifiers = self.__getModifiersOn()
-            shifted = self.modifiers[Key.CAPSLOCK] ^ self.modifiers[Key.SHIFT]
-            key = self.interface.lookup_string(keyCode, shifted, numLock, self.modifiers[Key.ALT_GR])
-            rawKey = self.interface.lookup_string(keyCode, False, False, False)
-            
-            for target in self.listeners:
-                target.handle_keypress(rawKey, modifiers, key, windowName, windowClass)                
+            lookup = self.interface.lookup_string
+            while queue:
+                keyCode, windowName, windowClass = queue.popleft()
+                if keyCode is None and windowName is None:
+                    return
+                if len(self.listeners) == 0:
+                    # Nobody to deliver to, so don't bother looking up the key
+                    continue
+                
+                modifiers = self.__getModifiersOn()
+                shifted = self.modCapsLock ^ self.modShift
+                key = lookup(keyCode, shifted, self.modNumLock, self.modAltGr)
+                rawKey = lookup(keyCode, False, False, False)
                 
-            self.queue.task_done()
+                for target in self.listeners:
+                    target.handle_keypress(rawKey, modifiers, key, windowName, windowClass)
             
     def handle_mouse_click(self, rootX, rootY, relX, relY, button, windowInfo):
         for target in self.listeners:
@@ -215,41 +350,17 @@ class IoMediator(threading.Thread):
         """
         Sends the given string for output.
         """
-        if len(string) == 0:
+        plan = _plan_send(string)
+        if len(plan) == 0:
+            # Nothing to send (e.g. empty string or only dangling modifiers), so leave modifiers alone
             return
-
-        k = Key()
-        
-        string = string.replace('\n', "<enter>")
-        string = string.replace('\t', "<tab>")
         
         _logger.debug("Send via event interface")
         self.__clearModifiers()
-        modifiers = []            
-        for section in KEY_SPLIT_RE.split(string):
-            if len(section) > 0:
-                if k.is_key(section[:-1]) and section[-1] == '+' and section[:-1] in MODIFIERS:
-                    # Section is a modifier application (modifier followed by '+')
-                    modifiers.append(section[:-1])
-                    
-                else:
-                    if len(modifiers) > 0:
-                        # Modifiers ready for application - send modified key
-                        if k.is_key(section):
-                            self.interface.send_modified_key(section, modifiers)
-                            modifiers = []
-                        else:
-                            self.interface.send_modified_key(section[0], modifiers)
-                            if len(section) > 1:
-                                self.interface.send_string(section[1:])
-                            modifiers = []
-                    else:
-                        # Normal string/key operation                    
-                        if k.is_key(section):
-                            self.interface.send_key(section)
-                        else:
-                            self.interface.send_string(section)
-                            
+        interface = self.interface
+        for methodName, args in plan:
+            getattr(interface, methodName)(*args)
+                        
         self.__reapplyModifiers()
         
     def paste_string(self, string, pasteCommand):
@@ -258,14 +369,14 @@ class IoMediator(threading.Thread):
             self.interface.send_string_clipboard(string, pasteCommand)
         
     def remove_string(self, string):
-        backspaces = -1 # Start from -1 to discount the backspace already pressed by the user
-        k = Key()
+        # Every character takes one backspace, except key names (e.g. <enter>) which only take one each.
+        # Start from -1 to discount the backspace already pressed by the user
+        backspaces = len(string) - 1
         
-        for section in KEY_SPLIT_RE.split(string):
-            if k.is_key(section):
-                backspaces += 1
-            else:
-                backspaces += len(section)
+        for match in KEY_SPLIT_RE.finditer(string):
+            section = match.group(0)
+            if Key.is_key(section):
+                backspaces -= len(section) - 1
                 
         self.send_backspace(backspaces)
         
@@ -289,26 +400,22 @@ class IoMediator(threading.Thread):
         """
         Sends the given number of left key presses.
         """
-        for i in range(count):
-            self.interface.send_key(Key.LEFT)
+        self.interface.send_key_repeat(Key.LEFT, count)
         
     def send_right(self, count):
-        for i in range(count):
-            self.interface.send_key(Key.RIGHT)
+        self.interface.send_key_repeat(Key.RIGHT, count)
     
     def send_up(self, count):
         """
         Sends the given number of up key presses.
         """        
-        for i in range(count):
-            self.interface.send_key(Key.UP)
+        self.interface.send_key_repeat(Key.UP, count)
         
     def send_backspace(self, count):
         """
         Sends the given number of backspace key presses.
         """
-        for i in range(count):
-            self.interface.send_key(Key.BACKSPACE)
+        self.interface.send_key_repeat(Key.BACKSPACE, count)
         
     def send_mouse_click(self, x, y, button, relative):
         self.interface.send_mouse_click(x, y, button, relative)
@@ -324,8 +431,8 @@ class IoMediator(threading.Thread):
     def __clearModifiers(self):
         self.releasedModifiers = []
         
-        for modifier in self.modifiers.keys():
-            if self.modifiers[modifier] and not modifier in (Key.CAPSLOCK, Key.NUMLOCK):
+        for modifier in MODIFIERS:
+            if getattr(self, MODIFIER_ATTRIBUTES[modifier]) and not modifier in (Key.CAPSLOCK, Key.NUMLOCK):
                 self.releasedModifiers.append(modifier)
                 self.interface.release_key(modifier)
         
@@ -333,14 +440,16 @@ class IoMediator(threading.Thread):
         for modifier in self.releasedModifiers:
             self.interface.press_key(modifier)
             
+    def __setModifier(self, modifier, state):
+        setattr(self, MODIFIER_ATTRIBUTES[modifier], state)
+        if modifier in HELD_MODIFIER_BITS:
+            if state:
+                self.heldMask |= HELD_MODIFIER_BITS[modifier]
+            else:
+                self.heldMask &= ~HELD_MODIFIER_BITS[modifier]
+            
     def __getModifiersOn(self):
-        modifiers = []
-        for modifier in HELD_MODIFIERS:
-            if self.modifiers[modifier]:
-                modifiers.append(modifier)
-        
-        modifiers.sort()
-        return modifiers
+        return HELD_MODIFIER_TABLE[self.heldMask]
 
 class Waiter:
     """
@@ -348,7 +457,7 @@ class Waiter:
     """
     
     def __init__(self, rawKey, modifiers, button, timeOut):
-        IoMediator.listeners.append(self)
+        IoMediator.add_listener(self)
         self.rawKey = rawKey
         self.modifiers = modifiers
         self.button = button
@@ -363,7 +472,7 @@ class Waiter:
         
     def handle_keypress(self, rawKey, modifiers, key, *args):
         if rawKey == self.rawKey and modifiers == self.modifiers:
-            IoMediator.listeners.remove(self)
+            IoMediator.remove_listener(self)
             self.event.set()
     
     def handle_mouseclick(self, rootX, rootY, relX, relY, button, windowInfo):
@@ -383,17 +492,17 @@ class KeyGrabber:
         # In QT version, sometimes the mouseclick event arrives before we finish initialising
         # sleep slightly to prevent this
         time.sleep(0.1)
-        IoMediator.listeners.append(self)
+        IoMediator.add_listener(self)
         CURRENT_INTERFACE.grab_keyboard()
                  
     def handle_keypress(self, rawKey, modifiers, key, *args):
         if not rawKey in MODIFIERS:
-            IoMediator.listeners.remove(self)
+            IoMediator.remove_listener(self)
             self.targetParent.set_key(rawKey, modifiers)
             CURRENT_INTERFACE.ungrab_keyboard()
     
     def handle_mouseclick(self, rootX, rootY, relX, relY, button, windowInfo):
-        IoMediator.listeners.remove(self)
+        IoMediator.remove_listener(self)
         CURRENT_INTERFACE.ungrab_keyboard()
         self.targetParent.cancel_grab()
 
@@ -408,7 +517,7 @@ class Recorder(KeyGrabber):
         
     def start(self, delay):
         time.sleep(0.1)
-        IoMediator.listeners.append(self)
+        IoMediator.add_listener(self)
         self.targetParent.start_record()
         self.startTime = time.time()
         self.delay = delay
@@ -416,7 +525,7 @@ class Recorder(KeyGrabber):
         
     def start_withgrab(self):
         time.sleep(0.1)
-        IoMediator.listeners.append(self)
+        IoMediator.add_listener(self)
         self.targetParent.start_record()
         self.startTime = time.time()
         self.delay = 0
@@ -426,7 +535,7 @@ class Recorder(KeyGrabber):
     
     def stop(self):
         if self in IoMediator.listeners:
-            IoMediator.listeners.remove(self)
+            IoMediator.remove_listener(self)
             if self.insideKeys:
                 self.targetParent.end_key_sequence()
             self.insideKeys = False
@@ -434,7 +543,7 @@ class Recorder(KeyGrabber):
     def stop_withgrab(self):
         CURRENT_INTERFACE.ungrab_keyboard()
         if self in IoMediator.listeners:
-            IoMediator.listeners.remove(self)
+            IoMediator.remove_listener(self)
             if self.insideKeys:
                 self.targetParent.end_key_sequence()
             self.insideKeys = False        
@@ -484,12 +593,12 @@ class WindowGrabber:
 
     def start(self):
         time.sleep(0.1)
-        IoMediator.listeners.append(self)
+        IoMediator.add_listener(self)
 
     def handle_keypress(self, rawKey, modifiers, key, *args):
         pass
 
     def handle_mouseclick(self, rootX, rootY, relX, relY, button, windowInfo):
-        IoMediator.listeners.remove(self)
+        IoMediator.remove_listener(self)
         self.dialog.receive_window_info(windowInfo)
 
@@ -33,12 +33,70 @@ def make_wordchar_re(wordChars):
 def extract_wordchars(regex):
     return regex[2:-1]
 
-def get_value_or_default(jsonData, key, default):
-    if key in jsonData:
-        return jsonData[key]
-    else:
-        return default
+# Compiled word char and window filter regexes, keyed by pattern. Most items share the same
+# few patterns (e.g. DEFAULT_WORDCHAR_REGEX), so they can share the compiled object too.
+REGEX_CACHE_SIZE = 256
+_regexCache = {}
+
+def _compile_regex(pattern):
+    try:
+        return _regexCache[pattern]
+    except KeyError:
+        pass
+        
+    regex = re.compile(pattern, re.UNICODE)
+    if len(_regexCache) >= REGEX_CACHE_SIZE:
+        _regexCache.clear()
+    _regexCache[pattern] = regex
+    return regex
+
+# Functions testing a single character against a word char regex, keyed by pattern
+WORD_CHAR_CACHE_SIZE = 1024
+_wordCharTests = {}
+
+def _get_word_char_test(pattern):
+    """
+    Get a function testing whether a single character matches the given word char regex.
+    The result for each character is remembered, as the same few characters are tested
+    against every abbreviation on every keypress.
+    """
+    try:
+        return _wordCharTests[pattern]
+    except KeyError:
+        pass
+        
+    regex = _compile_regex(pattern)
+    results = {}
     
+    def is_word_char(char):
+        try:
+            return results[char]
+        except KeyError:
+            if len(results) >= WORD_CHAR_CACHE_SIZE:
+                results.clear()
+            result = results[char] = regex.match(char) is not None
+            return result
+            
+    if len(_wordCharTests) >= REGEX_CACHE_SIZE:
+        _wordCharTests.clear()
+    _wordCharTests[pattern] = is_word_char
+    return is_word_char
+
+# The last input buffer passed to _lower_buffer and its lowercased version
+_lastLowered = (None, None)
+
+def _lower_buffer(buffer):
+    """
+    Get the lowercased version of the given input buffer. The service checks the same buffer
+    object against every item on each keypress, so it only needs lowercasing once.
+    """
+    global _lastLowered
+    lastBuffer, lowered = _lastLowered
+    if buffer is not lastBuffer:
+        lowered = buffer.lower()
+        _lastLowered = (buffer, lowered)
+    return lowered
+
 def get_safe_path(basePath, name, ext=""):
     name = SPACES_RE.sub('_', name)
     safeName = ''.join([char for char in name if char.isalnum() or char in "_ -."])
@@ -71,6 +129,8 @@ class AbstractAbbreviation:
         self.immediate = False
         self.triggerInside = False
         self.set_word_chars(DEFAULT_WORDCHAR_REGEX)
+        # Last (buffer, abbreviations, result) seen by _get_trigger_abbreviation
+        self.__lastTrigger = (None, None, None)
 
     def get_serializable(self):
         d = {
@@ -101,10 +161,13 @@ class AbstractAbbreviation:
         self.ignoreCase = abbr.ignoreCase
         self.immediate = abbr.immediate
         self.triggerInside = abbr.triggerInside
-        self.set_word_chars(abbr.get_word_chars())
+        # Share the compiled word char regex and test rather than going back through the pattern
+        self.wordChars = abbr.wordChars
+        self.isWordChar = abbr.isWordChar
                         
     def set_word_chars(self, regex):
-        self.wordChars = re.compile(regex, re.UNICODE)
+        self.wordChars = _compile_regex(regex)
+        self.isWordChar = _get_word_char_test(regex)
         
     def get_word_chars(self):
         return self.wordChars.pattern
@@ -130,20 +193,44 @@ class AbstractAbbreviation:
         
         @param buffer Input buffer to be checked (as string)
         """
-        for abbr in self.abbreviations:
-            if self.__checkInput(buffer, abbr):
-                return True
-        
-        return False
+        return self._get_trigger_abbreviation(buffer) is not None
         
     def _get_trigger_abbreviation(self, buffer):
+        """
+        Get the abbreviation triggered by the given input buffer, or None.
+        
+        The same buffer object is checked several times for a keypress (check_input, then
+        build_phrase/process_buffer and friends), so the last result is remembered. Replacing
+        the abbreviation list, as the abbreviation dialogs do, invalidates it.
+        """
+        lastBuffer, lastAbbreviations, result = self.__lastTrigger
+        if buffer is lastBuffer and self.abbreviations is lastAbbreviations:
+            return result
+            
+        result = None
         for abbr in self.abbreviations:
             if self.__checkInput(buffer, abbr):
-                return abbr
+                result = abbr
+                break
         
-        return None      
+        self.__lastTrigger = (buffer, self.abbreviations, result)
+        return result
         
     def __checkInput(self, buffer, abbr):
+        # Quick rejection before partitioning: the abbreviation can only trigger if it is
+        # at the end of the buffer (immediate), or followed by exactly one trigger character.
+        # Lowercasing maps characters one to one, so only that tail needs lowercasing.
+        if self.ignoreCase:
+            matchString = buffer[-len(abbr) - 1:].lower()
+        else:
+            matchString = buffer
+            
+        if self.immediate:
+            if not matchString.endswith(abbr):
+                return False
+        elif not matchString.endswith(abbr, 0, len(matchString) - 1):
+            return False
+            
         stringBefore, typedAbbr, stringAfter = self._partition_input(buffer, abbr)
         
         if len(typedAbbr) > 0:            
@@ -152,7 +239,7 @@ class AbstractAbbreviation:
                 # If not immediate expansion, check last character
                 if len(stringAfter) == 1:
                     # Have a character after abbr
-                    if self.wordChars.match(stringAfter):
+                    if self.isWordChar(stringAfter):
                         # last character(s) is a word char, can't send expansion
                         return False
                     elif len(stringAfter) > 1:
@@ -170,7 +257,7 @@ class AbstractAbbreviation:
             # Check chars ahead of abbr
             # length of stringBefore should always be > 0
             if len(stringBefore) > 0:
-                if self.wordChars.match(stringBefore[-1]):
+                if self.isWordChar(stringBefore[-1]):
                     # last char before is a word char
                     if not self.triggerInside:
                         # can't trigger when inside a word
@@ -185,7 +272,7 @@ class AbstractAbbreviation:
         Partition the input into text before, text after, and typed abbreviation (if it exists)
         """
         if self.ignoreCase:
-            matchString = currentString.lower()
+            matchString = _lower_buffer(currentString)
             stringBefore, typedAbbr, stringAfter = matchString.rpartition(abbr)
             abbrStart = len(stringBefore)
             abbrEnd = abbrStart + len(typedAbbr)
@@ -195,6 +282,79 @@ class AbstractAbbreviation:
             
         return (stringBefore, typedAbbr, stringAfter)
     
+
+
+class AbbreviationIndex:
+    """
+    Index of the folders and items that are triggered by abbreviation, keyed by abbreviation.
+    
+    An abbreviation can only trigger when it ends the input buffer or is followed by one trigger
+    character, so looking up the buffer tails of each abbreviation length finds the few folders
+    and items worth checking, instead of checking all of them on every keypress.
+    """
+    
+    def __init__(self, folders, items):
+        self.caseSensitive = {}
+        self.ignoreCase = {}
+        self.lengths = set()
+        self.__add_all(folders, True)
+        self.__add_all(items, False)
+        self.lengths = sorted(self.lengths)
+        
+    def __add_all(self, targets, isFolder):
+        for position, target in enumerate(targets):
+            if TriggerMode.ABBREVIATION not in target.modes:
+                continue
+            if target.ignoreCase:
+                index = self.ignoreCase
+            else:
+                index = self.caseSensitive
+                
+            for abbr in target.abbreviations:
+                if len(abbr) > 0:
+                    index.setdefault(abbr, []).append((isFolder, position, target))
+                    self.lengths.add(len(abbr))
+                    
+    def get_candidates(self, buffer):
+        """
+        Get the folders and items with an abbreviation at the end of the given buffer, or
+        followed by a single character. Only these can match the buffer.
+        
+        @param buffer: the input buffer
+        @return: tuple of (folders, items) lists, each in the order originally given
+        """
+        matches = {}
+        loweredTail = None
+        bufferLength = len(buffer)
+        
+        for length in self.lengths:
+            if length > bufferLength:
+                break
+            
+            if len(self.caseSensitive) > 0:
+                self.__collect(self.caseSensitive, buffer, length, matches)
+            if len(self.ignoreCase) > 0:
+                if loweredTail is None:
+                    # Only the tail can be probed, so there is no need to lowercase the whole buffer
+                    loweredTail = buffer[-self.lengths[-1] - 1:].lower()
+                self.__collect(self.ignoreCase, loweredTail, length, matches)
+        
+        folders = []
+        items = []
+        for (isFolder, position), target in sorted(matches.iteritems()):
+            if isFolder:
+                folders.append(target)
+            else:
+                items.append(target)
+        
+        return (folders, items)
+        
+    def __collect(self, index, buffer, length, matches):
+        for tail in (buffer[-length:], buffer[-length - 1:-1]):
+            if tail in index:
+                for isFolder, position, target in index[tail]:
+                    matches[(isFolder, position)] = target
+                    
             
 class AbstractWindowFilter:
     
@@ -221,7 +381,7 @@ class AbstractWindowFilter:
     
     def set_window_titles(self, regex):
         if regex is not None:
-            self.windowInfoRegex = re.compile(regex, re.UNICODE)
+            self.windowInfoRegex = _compile_regex(regex)
         else:
             self.windowInfoRegex = regex
             
@@ -301,7 +461,7 @@ class AbstractHotkey(AbstractWindowFilter):
         self.set_hotkey(data["modifiers"], data["hotKey"])
         
     def copy_hotkey(self, theHotkey):
-        [self.modifiers.append(modifier) for modifier in theHotkey.modifiers]
+        self.modifiers = list(theHotkey.modifiers)
         self.hotKey = theHotkey.hotKey
         
     def set_hotkey(self, modifiers, key):
@@ -310,8 +470,10 @@ class AbstractHotkey(AbstractWindowFilter):
         self.hotKey = key
         
     def check_hotkey(self, modifiers, key, windowTitle):
-        if self.hotKey is not None and self._should_trigger_window_title(windowTitle):
-            return (self.modifiers == modifiers) and (self.hotKey == key)
+        # Compare the key first, as it rules out nearly every hotkey without running the window filter.
+        # Both modifier lists are sorted, so they can be compared directly.
+        if self.hotKey is not None and self.hotKey == key and self.modifiers == modifiers:
+            return bool(self._should_trigger_window_title(windowTitle))
         else:
             return False
 
@@ -323,18 +485,13 @@ class AbstractHotkey(AbstractWindowFilter):
             key = self.hotKey
             modifiers = self.modifiers
             
-        ret = ""
-
-        for modifier in modifiers:
-            ret += modifier
-            ret += "+"
-
         if key == ' ':
-            ret += "<space>"
+            key = "<space>"
+            
+        if len(modifiers) > 0:
+            return "+".join(modifiers) + "+" + key
         else:
-            ret += key
-
-        return ret
+            return key
     
         
 class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
@@ -508,23 +665,25 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
             return False
         
     def increment_usage_count(self):
-        self.usageCount += 1
-        if self.parent is not None:
-            self.parent.increment_usage_count()
+        folder = self
+        while folder is not None:
+            folder.usageCount += 1
+            folder = folder.parent
         
     def get_backspace_count(self, buffer):
         """
         Given the input buffer, calculate how many backspaces are needed to erase the text
         that triggered this folder.
         """
-        if TriggerMode.ABBREVIATION in self.modes and self.backspace:
-            if self._should_trigger_abbreviation(buffer):
-                abbr = self._get_trigger_abbreviation(buffer)
-                stringBefore, typedAbbr, stringAfter = self._partition_input(buffer, abbr)
-                return len(abbr) + len(stringAfter)
-        
-        if self.parent is not None:
-            return self.parent.get_backspace_count(buffer)
+        folder = self
+        while folder is not None:
+            if TriggerMode.ABBREVIATION in folder.modes and folder.backspace:
+                abbr = folder._get_trigger_abbreviation(buffer)
+                if abbr is not None:
+                    stringBefore, typedAbbr, stringAfter = folder._partition_input(buffer, abbr)
+                    return len(abbr) + len(stringAfter)
+            
+            folder = folder.parent
 
         return 0
     
@@ -532,15 +691,17 @@ class Folder(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         """
         Calculate how many keystrokes were used in triggering this folder (if applicable).
         """
-        if TriggerMode.ABBREVIATION in self.modes and self.backspace:
-            if self._should_trigger_abbreviation(buffer):
-                if self.immediate:
-                    return len(self.abbreviation)
-                else:
-                    return len(self.abbreviation) + 1
+        folder = self
+        while folder is not None:
+            if TriggerMode.ABBREVIATION in folder.modes and folder.backspace:
+                abbr = folder._get_trigger_abbreviation(buffer)
+                if abbr is not None:
+                    if folder.immediate:
+                        return len(abbr)
+                    else:
+                        return len(abbr) + 1
                         
-        if self.parent is not None:
-            return self.parent.calculate_input(buffer)
+            folder = folder.parent
 
         return 0        
         
@@ -681,7 +842,7 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         self.omitTrigger = data["omitTrigger"]
         self.matchCase = data["matchCase"]
         self.showInTrayMenu = data["showInTrayMenu"]
-        self.sendMode = get_value_or_default(data, "sendMode", SendMode.KEYBOARD)
+        self.sendMode = data.get("sendMode", SendMode.KEYBOARD)
         AbstractAbbreviation.load_from_serialized(self, data["abbreviation"])
         AbstractHotkey.load_from_serialized(self, data["hotkey"])
         AbstractWindowFilter.load_from_serialized(self, data["filter"])
@@ -749,9 +910,8 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         triggerFound = False
         
         if TriggerMode.ABBREVIATION in self.modes:
-            if self._should_trigger_abbreviation(buffer):
-                abbr = self._get_trigger_abbreviation(buffer)
-            
+            abbr = self._get_trigger_abbreviation(buffer)
+            if abbr is not None:
                 stringBefore, typedAbbr, stringAfter = self._partition_input(buffer, abbr)
                 triggerFound = True        
                 if self.backspace:
@@ -789,11 +949,12 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         Calculate how many keystrokes were used in triggering this phrase.
         """
         if TriggerMode.ABBREVIATION in self.modes:
-            if self._should_trigger_abbreviation(buffer):
+            abbr = self._get_trigger_abbreviation(buffer)
+            if abbr is not None:
                 if self.immediate:
-                    return len(self.abbreviation)
+                    return len(abbr)
                 else:
-                    return len(self.abbreviation) + 1
+                    return len(abbr) + 1
         
         # TODO - re-enable me if restoring predictive functionality
         #if TriggerMode.PREDICTIVE in self.modes:
@@ -859,9 +1020,9 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
                     break
             
             if not foundNavigationKey:
-                k = Key()
+                is_key = Key.is_key
                 for section in KEY_SPLIT_RE.split(secondpart):
-                    if not k.is_key(section) or section in [' ', '\n']:
+                    if not is_key(section) or section in [' ', '\n']:
                         expansion.lefts += len(section)
             
             expansion.string = firstpart + secondpart
@@ -872,7 +1033,9 @@ class Phrase(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
     def __repr__(self):
         return "Phrase('" + self.description + "')"
 
-class Expansion:
+class Expansion(object):
+    
+    __slots__ = ("string", "lefts", "backspaces")
     
     def __init__(self, string):
         self.string = string
@@ -890,6 +1053,8 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         AbstractWindowFilter.__init__(self)
         self.description = description
         self.code = code
+        self.__compiledCode = None
+        self.__compiledSource = None
         self.store = Store()
         self.modes = []
         self.usageCount = 0
@@ -1000,6 +1165,17 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
 
     def get_tuple(self):
         return ("text-x-python", self.description, self.get_abbreviations(), self.get_hotkey_string(), self)
+        
+    def get_compiled_code(self):
+        """
+        Get the compiled code object for the script. The code is only recompiled if it has
+        changed since the last call.
+        """
+        if self.__compiledCode is None or self.__compiledSource != self.code:
+            self.__compiledCode = compile(self.code, "<string>", "exec")
+            self.__compiledSource = self.code
+            
+        return self.__compiledCode
 
     def set_modes(self, modes):
         self.modes = modes
@@ -1019,8 +1195,8 @@ class Script(AbstractAbbreviation, AbstractHotkey, AbstractWindowFilter):
         string = ""
         
         if TriggerMode.ABBREVIATION in self.modes:
-            if self._should_trigger_abbreviation(buffer):
-                abbr = self._get_trigger_abbreviation(buffer)
+            abbr = self._get_trigger_abbreviation(buffer)
+            if abbr is not None:
                 stringBefore, typedAbbr, stringAfter = self._partition_input(buffer, abbr)
                 triggerFound = True        
                 if self.backspace:
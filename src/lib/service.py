@@ -125,8 +125,9 @@ class Service:
         if self.__shouldProcess(windowInfo):
             itemMatch = None
             menu = None
+            hotkey = (tuple(modifiers), rawKey)
 
-            for item in self.configManager.hotKeys:
+            for item in self.configManager.hotKeyIndex.get(hotkey, ()):
                 if item.check_hotkey(modifiers, rawKey, windowInfo):
                     itemMatch = item
                     break
@@ -141,7 +142,7 @@ class Service:
                     
             else:
                 logger.debug("No phrase/script matched hotkey")
-                for folder in self.configManager.hotKeyFolders:
+                for folder in self.configManager.hotKeyFolderIndex.get(hotkey, ()):
                     if folder.check_hotkey(modifiers, rawKey, windowInfo):
                         #menu = PopupMenu(self, [folder], [])
                         menu = ([folder], [])
@@ -175,12 +176,11 @@ class Service:
         
             if self.__updateStack(key):
                 currentInput = ''.join(self.inputStack)
-                item, menu = self.__checkTextMatches([], self.configManager.abbreviations,
-                                                    currentInput, windowInfo, True)
+                # Only folders/items with an abbreviation at the end of the input can match
+                folders, items = self.configManager.abbreviationIndex.get_candidates(currentInput)
+                item, menu = self.__checkTextMatches([], items, currentInput, windowInfo, True)
                 if not item or menu:
-                    item, menu = self.__checkTextMatches(self.configManager.allFolders,
-                                                         self.configManager.allItems,
-                                                         currentInput, windowInfo)
+                    item, menu = self.__checkTextMatches(folders, items, currentInput, windowInfo)
                                                          
                 if item:
                     self.__tryReleaseLock()
@@ -451,7 +451,7 @@ class ScriptRunner:
         self.mediator.send_backspace(backspaces)
 
         try:
-            exec script.code in scope
+            exec script.get_compiled_code() in scope
         except Exception, e:
             logger.exception("Script error")
             
@@ -468,4 +468,4 @@ class ScriptRunner:
     def run_subscript(self, script):
         scope = self.scope.copy()
         scope["store"] = script.store
-        exec script.code in scope
+        exec script.get_compiled_code() in scope
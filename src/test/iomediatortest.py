@@ -1,6 +1,7 @@
 import unittest
 
 from lib.iomediator import *
+from lib.iomediator import _split_tokens, _plan_send
 
 class IoMediatorTest(unittest.TestCase):
     
@@ -21,4 +22,31 @@ class IoMediatorTest(unittest.TestCase):
         self.assertEqual(result, ["", "<ctrl>", "y"])
         
         result = KEY_SPLIT_RE.split("Test<tab>More text")
-        self.assertEqual(result, ["Test", "<tab>", "More text"])        
\ No newline at end of file
+        self.assertEqual(result, ["Test", "<tab>", "More text"])        
+        
+    def testSplitTokens(self):
+        result = _split_tokens("<ctrl>+y asdf<tab>")
+        self.assertEqual(result, (("<ctrl>+", False, True), ("y asdf", False, False), ("<tab>", True, False)))
+        
+        result = _split_tokens("<table><ctrl>+y</table>")
+        self.assertEqual(result, (("<table>", False, False), ("<ctrl>+", False, True), ("y", False, False),
+                                  ("</table>", False, False)))
+        
+        # Repeated calls return the cached result
+        self.assertTrue(_split_tokens("<table><ctrl>+y</table>") is result)
+        
+    def testPlanSend(self):
+        result = _plan_send("<ctrl>+yz\n")
+        self.assertEqual(result, (("send_modified_key", ("y", ["<ctrl>"])), ("send_string", ("z",)),
+                                  ("send_key", ("<enter>",))))
+        
+        self.assertEqual(_plan_send("<shift>+<tab>"), (("send_modified_key", ("<tab>", ["<shift>"])),))
+        self.assertEqual(_plan_send(""), ())
+        self.assertEqual(_plan_send("<ctrl>+"), ())
+        
+    def testIsKey(self):
+        self.assertTrue(Key.is_key("<ctrl>"))
+        self.assertTrue(Key.is_key("<CTRL>"))
+        self.assertTrue(Key.is_key("<code42>"))
+        self.assertFalse(Key.is_key("<table>"))
+        self.assertFalse(Key.is_key("ctrl"))
@@ -0,0 +1,118 @@
+import random, unittest
+
+# configmanager must be imported ahead of model, which it imports in turn
+from lib.configmanager import *
+from lib.model import *
+
+WINDOW_INFO = (u"Window title", u"window.Class")
+
+def make_phrase(abbreviations, immediate=False, ignoreCase=False, triggerInside=False, parent=None):
+    phrase = Phrase(u"description", u"expansion")
+    phrase.parent = parent
+    phrase.set_modes([TriggerMode.ABBREVIATION])
+    phrase.abbreviations = abbreviations
+    phrase.immediate = immediate
+    phrase.ignoreCase = ignoreCase
+    phrase.triggerInside = triggerInside
+    return phrase
+
+def make_folder(abbreviations, immediate=False, ignoreCase=False):
+    folder = Folder(u"title")
+    folder.set_modes([TriggerMode.ABBREVIATION])
+    folder.abbreviations = abbreviations
+    folder.immediate = immediate
+    folder.ignoreCase = ignoreCase
+    return folder
+
+class AbbreviationIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parent = Folder(u"parent")
+
+    def testImmediateTail(self):
+        phrase = make_phrase([u"btw"], immediate=True, parent=self.parent)
+        index = AbbreviationIndex([], [phrase])
+
+        self.assertEqual(index.get_candidates(u"xx btw"), ([], [phrase]))
+        self.assertTrue(phrase.check_input(u"xx btw", WINDOW_INFO))
+        self.assertEqual(index.get_candidates(u"xx btwx "), ([], []))
+
+    def testTriggerCharTail(self):
+        phrase = make_phrase([u"btw"], parent=self.parent)
+        index = AbbreviationIndex([], [phrase])
+
+        # Both tails are candidates, but only a trigger character after the abbreviation matches
+        self.assertEqual(index.get_candidates(u"btw "), ([], [phrase]))
+        self.assertTrue(phrase.check_input(u"btw ", WINDOW_INFO))
+        self.assertEqual(index.get_candidates(u"btw"), ([], [phrase]))
+        self.assertFalse(phrase.check_input(u"btw", WINDOW_INFO))
+        self.assertEqual(index.get_candidates(u"btw  "), ([], []))
+
+    def testIgnoreCase(self):
+        ignoring = make_phrase([u"btw"], ignoreCase=True, parent=self.parent)
+        matching = make_phrase([u"btw"], parent=self.parent)
+        index = AbbreviationIndex([], [ignoring, matching])
+
+        self.assertEqual(index.get_candidates(u"say BtW "), ([], [ignoring]))
+        self.assertTrue(ignoring.check_input(u"say BtW ", WINDOW_INFO))
+        self.assertEqual(index.get_candidates(u"say btw "), ([], [ignoring, matching]))
+
+    def testShortBuffer(self):
+        phrase = make_phrase([u"btw"], parent=self.parent)
+        index = AbbreviationIndex([], [phrase])
+
+        self.assertEqual(index.get_candidates(u""), ([], []))
+        self.assertEqual(index.get_candidates(u"bt"), ([], []))
+        self.assertEqual(index.get_candidates(u"tw"), ([], []))
+
+    def testMultipleAbbreviations(self):
+        phrase = make_phrase([u"ab", u"xyz", u"b"], parent=self.parent)
+        index = AbbreviationIndex([], [phrase])
+
+        self.assertEqual(index.get_candidates(u"xyz."), ([], [phrase]))
+        self.assertEqual(index.get_candidates(u"ab "), ([], [phrase]))
+        # Returned once, even though several of its abbreviations are at the tail
+        self.assertEqual(index.get_candidates(u"ab"), ([], [phrase]))
+
+    def testOrderPreserved(self):
+        folders = [make_folder([u"ab"]), make_folder([u"zz"]), make_folder([u"b"], immediate=True)]
+        items = [make_phrase([u"b"], parent=self.parent), make_phrase([u"q"], parent=self.parent),
+                 make_phrase([u"ab"], parent=self.parent), make_phrase([u"AB"], ignoreCase=True, parent=self.parent)]
+        items[1].set_modes([TriggerMode.HOTKEY])
+        items[1].abbreviations = [u"ab"]
+        index = AbbreviationIndex(folders, items)
+
+        self.assertEqual(index.get_candidates(u"ab"), ([folders[0], folders[2]], [items[0], items[2]]))
+
+    def testMatchesFullScan(self):
+        rand = random.Random(3)
+        abbreviations = [u"btw", u"ab", u"a", u"Foo", u"x.y", u"aa", u"aba", u"b", u"tw"]
+        alphabet = u"abtwFOo .xy!\n"
+
+        for trial in xrange(100):
+            folders = []
+            items = []
+            for i in xrange(rand.randint(1, 12)):
+                if rand.random() < 0.3:
+                    target = Folder(u"folder")
+                    folders.append(target)
+                else:
+                    target = Phrase(u"phrase", u"expansion")
+                    target.parent = self.parent
+                    items.append(target)
+                target.set_modes(rand.choice([[], [TriggerMode.ABBREVIATION], [TriggerMode.HOTKEY],
+                                              [TriggerMode.ABBREVIATION, TriggerMode.HOTKEY]]))
+                target.abbreviations = rand.sample(abbreviations, rand.randint(1, 2))
+                target.immediate = rand.random() < 0.5
+                target.ignoreCase = rand.random() < 0.5
+                target.triggerInside = rand.random() < 0.5
+
+            index = AbbreviationIndex(folders, items)
+            for j in xrange(100):
+                buffer = u''.join(rand.choice(alphabet) for k in xrange(rand.randint(0, 10)))
+                candidateFolders, candidateItems = index.get_candidates(buffer)
+
+                self.assertEqual([f for f in candidateFolders if f.check_input(buffer, WINDOW_INFO)],
+                                 [f for f in folders if f.check_input(buffer, WINDOW_INFO)])
+                self.assertEqual([i for i in candidateItems if i.check_input(buffer, WINDOW_INFO)],
+                                 [i for i in items if i.check_input(buffer, WINDOW_INFO)])